@@ -21,15 +21,59 @@ Excel → KML converter (RU headers) — v3
   python excel_to_kml.py --excel "input.xlsx" --sheet "Лист1" --out "gorod.kml"
 """
 import argparse
-import hashlib
 import html
+import itertools
+import json
+import multiprocessing
+import os
 import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
+from openpyxl import load_workbook
+from pandas.api.types import is_numeric_dtype
+
+# Округ -> [(Район, [XML Placemark, ...]), ...]
+FolderTree = Iterable[Tuple[str, Iterable[Tuple[str, Iterable[str]]]]]
+
+REQUIRED_COLS = [
+    "Номер сообщения",
+    "Округ",
+    "Район",
+    "Адрес",
+    "Название объекта",
+    "Проблемная тема",
+    "Текст сообщения",
+    "Ссылки на фотографии сообщения",
+    "Широта",
+    "Долгота",
+]
+# Текстовые колонки читаем как str; Широта/Долгота — в родном (числовом) типе
+READ_DTYPES = {col: str for col in REQUIRED_COLS if col not in ("Широта", "Долгота")}
+TEXT_COLS = ["Номер сообщения", "Адрес", "Название объекта", "Проблемная тема", "Текст сообщения"]
+CATEGORY_COLS = ["Округ", "Район", "Проблемная тема"]
+HEADER_ROW = 3  # заголовки на 3-й строке листа
+# Строки, которые pandas.read_excel по умолчанию считает пропуском (STR_NA_VALUES)
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
+KML_NS = "http://www.opengis.net/kml/2.2"
+
+# Структура Placemark фиксирована: собираем строкой, без Element на каждый тег.
+# Все значения подставляются уже экранированными; description — готовый CDATA.
+PLACEMARK_TEMPLATE = (
+    "<Placemark><name>{name}</name>{style}<description>{desc}</description>"
+    "<Point><coordinates>{coords}</coordinates></Point></Placemark>\n"
+)
 
 
 def ts() -> str:
@@ -42,29 +86,34 @@ def app_base() -> Path:
     # Обычный запуск .py
     return Path(__file__).resolve().parent
 
-def ensure_float(s):
-    """Конвертирует число с запятой/точкой в float. Возвращает None при ошибке."""
-    if pd.isna(s):
-        return None
-    if isinstance(s, (int, float)):
-        return float(s)
-    s = str(s).strip().replace(" ", "").replace(",", ".")
-    try:
-        return float(s)
-    except ValueError:
-        return None
+_FLOAT_TRANS = str.maketrans({" ": "", ",": "."})
+
+
+def to_float_series(s: pd.Series) -> pd.Series:
+    """Конвертирует колонку с числами (запятая/точка, пробелы) в float. NaN при ошибке."""
+    if s.dtype == object:
+        s = s.infer_objects()  # ячейки-числа из openpyxl: object -> float64, если строк нет
+    if is_numeric_dtype(s):
+        return s.astype(np.float64)
+    # strip снимает и неразрывные пробелы по краям (их to_numeric не пропускает); затем один translate
+    return pd.to_numeric(s.astype(str).str.strip().str.translate(_FLOAT_TRANS), errors="coerce")
+
+
+def in_range_lat_lon(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Маска строк с корректными координатами по массивам float64 (NaN -> False)."""
+    return (lat >= -90) & (lat <= 90) & (lon >= -180) & (lon <= 180)
 
 
-def in_range_lat_lon(lat: float, lon: float) -> bool:
-    return lat is not None and lon is not None and -90 <= lat <= 90 and -180 <= lon <= 180
+def format_coordinates(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Строки KML "lon,lat,0" (%.8f) для всего массива сразу."""
+    return np.char.add(np.char.add(np.char.add(np.char.mod("%.8f", lon), ","), np.char.mod("%.8f", lat)), ",0")
 
 
-def kml_color_from_district(district: str) -> str:
+def hue_to_kml_color(h: int) -> str:
     """
-    Цвет KML (aabbggrr) детерминированно из названия района.
+    Цвет KML (aabbggrr) из тона h (0..359).
     Альфа=FF, HSV -> RGB (s=0.7, v=0.95).
     """
-    h = int(hashlib.md5(district.encode("utf-8")).hexdigest(), 16) % 360  # hue
     s, v = 0.7, 0.95
     c = v * s
     x = c * (1 - abs((h / 60) % 2 - 1))
@@ -87,6 +136,18 @@ def kml_color_from_district(district: str) -> str:
     return f"FF{B:02X}{G:02X}{R:02X}"  # aabbggrr
 
 
+_HUE_TABLE = [hue_to_kml_color(h) for h in range(360)]
+
+
+def district_style(district: str) -> Tuple[str, str]:
+    """
+    (style_id, цвет KML) детерминированно из названия района.
+    Хэш некриптографический (crc32): нужен только стабильный id и тон.
+    """
+    h = zlib.crc32(district.encode("utf-8"))
+    return f"style_{h:08x}", _HUE_TABLE[h % 360]
+
+
 def create_style(style_id: str, color: str) -> ET.Element:
     style = ET.Element("Style", id=style_id)
     icon_style = ET.SubElement(style, "IconStyle")
@@ -99,27 +160,111 @@ def create_style(style_id: str, color: str) -> ET.Element:
     return style
 
 
+ADDR_PREFIX = "<b>Адрес:</b> "
+OBJ_PREFIX = "<b>Объект:</b> "
+TOPIC_PREFIX = "<b>Проблема:</b> "
+TEXT_PREFIX = "<b>Текст:</b> "
+PHOTO_PREFIX = "<b>Фото:</b> "
+
+
+@lru_cache(maxsize=8192)
+def _esc(s: str) -> str:
+    """html.escape с кэшем: адреса/объекты/темы сильно повторяются между строками."""
+    return html.escape(s)
+
+
 def build_description(addr: str, obj: str, topic: str, text: str, links: List[str]) -> str:
+    """Все значения приходят уже экранированными (см. _esc); пустые пропускаются."""
     parts = []
     if addr:
-        parts.append(f"<b>Адрес:</b> {html.escape(str(addr))}")
+        parts.append(ADDR_PREFIX + addr)
     if obj:
-        parts.append(f"<b>Объект:</b> {html.escape(str(obj))}")
+        parts.append(OBJ_PREFIX + obj)
     if topic:
-        parts.append(f"<b>Проблема:</b> {html.escape(str(topic))}")
+        parts.append(TOPIC_PREFIX + topic)
     if text:
-        parts.append(f"<b>Текст:</b> {html.escape(str(text))}")
+        parts.append(TEXT_PREFIX + text)
     if links:
-        a = []
-        for i, u in enumerate(links, 1):
-            u = u.strip()
-            if not u:
-                continue
-            a.append(f'<a href="{html.escape(u)}" target="_blank">Фото {i}</a>')
-        if a:
-            parts.append(f"<b>Фото:</b> " + " | ".join(a))
-    html_block = "<br/>".join(parts)
-    return f"<![CDATA[{html_block}]]>"
+        parts.append(
+            PHOTO_PREFIX
+            + " | ".join(['<a href="' + u + '" target="_blank">Фото ' + str(i) + "</a>" for i, u in enumerate(links, 1)])
+        )
+    return "<![CDATA[" + "<br/>".join(parts) + "]]>"
+
+
+def write_kml(out_path: Path, doc_name: str, styles: List[ET.Element], folders: FolderTree) -> int:
+    """
+    Потоковая запись KML: Placemark'и (готовые XML-строки) пишутся в файл по мере генерации,
+    в памяти только текущая строка. Возвращает количество записанных Placemark.
+    """
+    written = 0
+    with open(out_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<kml xmlns="{KML_NS}">\n<Document>\n')
+        f.write("<name>" + html.escape(doc_name) + "</name>\n")
+        for style in styles:
+            f.write(ET.tostring(style, encoding="unicode") + "\n")
+
+        # Folders: Okrug -> Rayon
+        for okrug, rayons in folders:
+            f.write("<Folder>\n<name>" + _esc(okrug) + "</name>\n")
+            for rayon, pms in rayons:
+                f.write("<Folder>\n<name>" + _esc(rayon) + "</name>\n")
+                for pm in pms:
+                    f.write(pm)
+                    written += 1
+                f.write("</Folder>\n")
+            f.write("</Folder>\n")
+        f.write("</Document>\n</kml>\n")
+    return written
+
+
+def _cell_value(v):
+    """Приводит значение ячейки openpyxl к тому, что вернул бы pandas.read_excel."""
+    if isinstance(v, float):
+        return int(v) if v.is_integer() else v
+    if isinstance(v, str) and v in NA_STRINGS:
+        return None
+    return v
+
+
+def read_sheet(excel_path: Path, sheet_name: str) -> pd.DataFrame:
+    """
+    Читает нужные колонки листа в DataFrame.
+    .xlsx — потоково через openpyxl (read_only), .xlsm — через pandas.
+    """
+    if excel_path.suffix.lower() == ".xlsm":
+        return pd.read_excel(
+            excel_path,
+            sheet_name=sheet_name,
+            header=HEADER_ROW - 1,
+            dtype=READ_DTYPES,
+            engine="openpyxl",
+            usecols=lambda c: c in REQUIRED_COLS,
+        )
+
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise SystemExit(f"{excel_path.name}: лист не найден: {sheet_name}")
+        rows = wb[sheet_name].iter_rows(min_row=HEADER_ROW, values_only=True)
+        header = next(rows, ())
+        col_idx: Dict[str, int] = {}
+        for i, h in enumerate(header):
+            if h in REQUIRED_COLS and h not in col_idx:
+                col_idx[h] = i
+        data: Dict[str, list] = {c: [] for c in col_idx}
+        last_filled = 0
+        for n, row in enumerate(rows, 1):
+            for c, i in col_idx.items():
+                data[c].append(_cell_value(row[i]) if i < len(row) else None)
+            if any(v is not None for v in row):
+                last_filled = n
+    finally:
+        wb.close()
+
+    # Хвостовые пустые строки отбрасываем (как pandas)
+    return pd.DataFrame({c: vals[:last_filled] for c, vals in data.items()}, dtype=object)
 
 
 def excel_to_kml(excel_path: Path, sheet_name: str, out_path: Path) -> Tuple[int, int, List[str]]:
@@ -131,108 +276,100 @@ def excel_to_kml(excel_path: Path, sheet_name: str, out_path: Path) -> Tuple[int
     if excel_path.suffix.lower() not in {".xlsx", ".xlsm"}:
         raise SystemExit(f"{excel_path.name}: поддерживаются только .xlsx/.xlsm (сконвертируйте .xls в .xlsx)")
 
-    df = pd.read_excel(excel_path, sheet_name=sheet_name, header=2, dtype=str)
-    required_cols = [
-        "Номер сообщения",
-        "Округ",
-        "Район",
-        "Адрес",
-        "Название объекта",
-        "Проблемная тема",
-        "Текст сообщения",
-        "Ссылки на фотографии сообщения",
-        "Широта",
-        "Долгота",
-    ]
-    for col in required_cols:
+    df = read_sheet(excel_path, sheet_name)
+    for col in REQUIRED_COLS:
         if col not in df.columns:
             raise SystemExit(f"{excel_path.name}: отсутствует обязательная колонка: {col}")
 
-    # Normalize and validate
-    df["Широта_num"] = df["Широта"].map(ensure_float)
-    df["Долгота_num"] = df["Долгота"].map(ensure_float)
+    # Малое число уникальных значений: category хранит каждую строку один раз
+    for col in CATEGORY_COLS:
+        df[col] = df[col].astype("category")
 
-    problems: List[str] = []
+    # Normalize and validate (векторно, без построчного apply); координаты — локальные массивы, не колонки df
+    lat_arr = to_float_series(df["Широта"]).to_numpy(dtype=np.float64)
+    lon_arr = to_float_series(df["Долгота"]).to_numpy(dtype=np.float64)
 
-    def valid_row(row) -> bool:
-        if pd.isna(row["Номер сообщения"]) or str(row["Номер сообщения"]).strip() == "":
-            problems.append(f"{excel_path.name}: пустой 'Номер сообщения' в строке Excel {row.name + 1}")
-            return False
-        lat, lon = row["Широта_num"], row["Долгота_num"]
-        if not in_range_lat_lon(lat, lon):
-            problems.append(
-                f"{excel_path.name}: неверные координаты в строке Excel {row.name + 1}: lat={row['Широта']}, lon={row['Долгота']}"
-            )
-            return False
-        return True
+    mask_num = (df["Номер сообщения"].notna() & df["Номер сообщения"].astype(str).str.strip().ne("")).to_numpy()
+    valid = mask_num & in_range_lat_lon(lat_arr, lon_arr)
 
-    df_valid = df[df.apply(valid_row, axis=1)].copy()
+    problems: List[str] = [
+        f"{excel_path.name}: пустой 'Номер сообщения' в строке Excel {df.index[i] + 1}"
+        if not mask_num[i]
+        else f"{excel_path.name}: неверные координаты в строке Excel {df.index[i] + 1}: "
+        f"lat={df['Широта'].iat[i]}, lon={df['Долгота'].iat[i]}"
+        for i in np.flatnonzero(~valid)
+    ]
 
-    # KML root
-    kml = ET.Element("kml", xmlns="http://www.opengis.net/kml/2.2")
-    doc = ET.SubElement(kml, "Document")
-    ET.SubElement(doc, "name").text = out_path.name
+    # strip — только по отобранным строкам (assign от полного df вернул бы отброшенные строки при пустом df_valid)
+    df_valid = df[valid].copy()
+    # Стили — только для непустых районов (до astype(str), иначе NaN станет районом "nan")
+    districts = sorted(df_valid["Район"].dropna().astype(str).str.strip().unique())
+    for col in ("Округ", "Район"):
+        df_valid[col] = df_valid[col].astype(str).str.strip().astype("category")
+    # Текстовые поля: пустые -> "", strip — одним векторным проходом на колонку, а не на каждую строку
+    for col in TEXT_COLS:
+        stripped = df_valid[col].astype("string").fillna("").str.strip()
+        df_valid[col] = stripped.astype("category") if col in CATEGORY_COLS else stripped
 
     # Styles per district
-    districts = sorted(df_valid["Район"].dropna().unique())
-    style_ids: Dict[str, str] = {}
+    style_urls: Dict[str, str] = {}  # район -> готовый тег <styleUrl>#style_...</styleUrl>
+    styles: List[ET.Element] = []
     for d in districts:
-        sid = f"style_{hashlib.md5(d.encode('utf-8')).hexdigest()[:8]}"
-        style_ids[d] = sid
-        doc.append(create_style(sid, kml_color_from_district(d)))
-
-    # Folders: Okrug -> Rayon
-    folder_map: Dict[Tuple[str, str], ET.Element] = {}
-    okrug_folders: Dict[str, ET.Element] = {}
-
-    def get_okrug_folder(okrug: str) -> ET.Element:
-        if okrug not in okrug_folders:
-            f = ET.SubElement(doc, "Folder")
-            ET.SubElement(f, "name").text = okrug
-            okrug_folders[okrug] = f
-        return okrug_folders[okrug]
-
-    def get_pair_folder(okrug: str, rayon: str) -> ET.Element:
-        key = (okrug, rayon)
-        if key not in folder_map:
-            of = get_okrug_folder(okrug)
-            rf = ET.SubElement(of, "Folder")
-            ET.SubElement(rf, "name").text = rayon
-            folder_map[key] = rf
-        return folder_map[key]
+        sid, color = district_style(d)
+        style_urls[d] = "<styleUrl>#" + sid + "</styleUrl>"
+        styles.append(create_style(sid, color))
+
+    # Колонки строк — массивы по позиции в df_valid, извлекаются один раз
+    names = df_valid["Номер сообщения"].to_numpy()
+    addrs = df_valid["Адрес"].to_numpy()
+    objs = df_valid["Название объекта"].to_numpy()
+    topics = df_valid["Проблемная тема"].to_numpy()
+    texts = df_valid["Текст сообщения"].to_numpy()
+    coords = format_coordinates(lat_arr[valid], lon_arr[valid])
+
+    # Ссылки: одно векторное разбиение по ";" на всю колонку, пустые отбрасываем, сразу экранируем
+    links_arr = (
+        df_valid["Ссылки на фотографии сообщения"]
+        .astype("string")
+        .fillna("")
+        .str.split(";")
+        .map(lambda xs: [html.escape(u) for u in (x.strip() for x in xs) if u])
+        .to_numpy()
+    )
+
+    def rayon_placemarks(positions: np.ndarray, style_url: Optional[str]) -> Iterator[str]:
+        style = style_url or ""
+        for i in positions:
+            yield PLACEMARK_TEMPLATE.format(
+                name=html.escape(names[i]),
+                style=style,
+                desc=build_description(
+                    _esc(addrs[i]),
+                    _esc(objs[i]),
+                    _esc(topics[i]),
+                    html.escape(texts[i]),
+                    links_arr[i],
+                ),
+                coords=coords[i],
+            )
 
-    written = 0
-    for _, row in df_valid.iterrows():
-        okrug = str(row["Округ"]).strip()
-        rayon = str(row["Район"]).strip()
-        folder = get_pair_folder(okrug, rayon)
-
-        name = str(row["Номер сообщения"]).strip()
-        addr = row["Адрес"]
-        obj = row["Название объекта"]
-        topic = row["Проблемная тема"]
-        text_msg = row["Текст сообщения"]
-        links_raw = row["Ссылки на фотографии сообщения"] or ""
-        links = [u.strip() for u in str(links_raw).split(";") if u.strip()]
-
-        lat = float(row["Широта_num"])
-        lon = float(row["Долгота_num"])
-
-        pm = ET.SubElement(folder, "Placemark")
-        ET.SubElement(pm, "name").text = name
-        sid = style_ids.get(rayon)
-        if sid:
-            ET.SubElement(pm, "styleUrl").text = f"#{sid}"
-        desc = ET.SubElement(pm, "description")
-        desc.text = build_description(addr, obj, topic, text_msg, links)
-        point = ET.SubElement(pm, "Point")
-        ET.SubElement(point, "coordinates").text = f"{lon:.8f},{lat:.8f},0"
-        written += 1
-
-    # Write file
-    xml_bytes = ET.tostring(kml, encoding="utf-8", method="xml")
-    text = xml_bytes.decode("utf-8").replace("><", ">\n<")
-    Path(out_path).write_text(text, encoding="utf-8")
+    # Папки Округ -> Район: позиции строк каждой пары — из groupby, стиль района — один раз на группу
+    groups = df_valid.groupby(["Округ", "Район"], sort=True, observed=True).indices
+
+    def folders() -> FolderTree:
+        for okrug, keys in itertools.groupby(sorted(groups), key=itemgetter(0)):
+            yield okrug, ((rayon, rayon_placemarks(groups[(okrug, rayon)], style_urls.get(rayon))) for _, rayon in keys)
+
+    # Write file: во временный файл рядом, затем атомарная замена —
+    # при ошибке прежний KML остаётся нетронутым, недописанный не появляется
+    out_path = Path(out_path)
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    try:
+        written = write_kml(tmp_path, out_path.name, styles, folders())
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
     return len(df), written, problems
 
@@ -249,9 +386,59 @@ def collect_excel_files(in_dir: Path) -> List[Path]:
     return sorted(files)
 
 
-def process_dir(in_dir: Path, out_dir: Optional[Path], sheet_name: str) -> int:
+def _worker(task: Tuple[Path, str, Path]) -> Tuple[str, str, int, int, List[str], Optional[str]]:
+    """
+    Обработка одного файла в процессе пула.
+    Возвращает: (excel_name, out_name, total_rows, written_count, problems_log, error).
+    """
+    x, sheet_name, out_path = task
+    try:
+        src = source_memo(x, sheet_name)  # до чтения: правка Excel во время обработки не попадёт в метку
+        total, written, problems = excel_to_kml(x, sheet_name, out_path)
+        memo_path(out_path).write_text(json.dumps({**src, **kml_memo(out_path)}, ensure_ascii=False), encoding="utf-8")
+        return x.name, out_path.name, total, written, problems, None
+    except SystemExit as e:
+        return x.name, out_path.name, 0, 0, [], str(e)
+    except Exception as e:
+        return x.name, out_path.name, 0, 0, [], str(e)
+
+
+def memo_path(out_path: Path) -> Path:
+    """Файл-метка рядом с KML: из какого Excel/листа собран и какой KML получился."""
+    return out_path.with_name(out_path.name + ".meta")
+
+
+def source_memo(xlsx_path: Path, sheet_name: str) -> Dict[str, object]:
+    st = xlsx_path.stat()
+    return {"sheet": sheet_name, "src_size": st.st_size, "src_mtime_ns": st.st_mtime_ns}
+
+
+def kml_memo(out_path: Path) -> Dict[str, object]:
+    st = out_path.stat()
+    return {"kml_size": st.st_size, "kml_mtime_ns": st.st_mtime_ns}
+
+
+def is_up_to_date(xlsx_path: Path, sheet_name: str, out_path: Path) -> bool:
+    """
+    KML собран из того же листа неизменённого Excel и сам не менялся после этого
+    (например, не перезаписан запуском с --excel).
+    """
+    if not out_path.exists():
+        return False
+    try:
+        memo = json.loads(memo_path(out_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return memo == {**source_memo(xlsx_path, sheet_name), **kml_memo(out_path)}
+
+
+def process_dir(
+    in_dir: Path, out_dir: Optional[Path], sheet_name: str, jobs: Optional[int] = None, force: bool = False
+) -> int:
     """
-    Обрабатывает все .xlsx/.xlsm в папке.
+    Обрабатывает все .xlsx/.xlsm в папке (файлы — параллельно, по процессу на файл).
+    jobs — число процессов; по умолчанию min(cpu_count, число файлов).
+    Файлы, чей KML уже собран из того же листа неизменённого Excel, пропускаются (если не force).
     Возвращает количество успешно созданных KML.
     """
     if not in_dir.exists():
@@ -266,24 +453,46 @@ def process_dir(in_dir: Path, out_dir: Optional[Path], sheet_name: str) -> int:
         print(f"[WARN] В папке нет .xlsx/.xlsm файлов: {in_dir}")
         return 0
 
-    ok_count = 0
+    tasks = []
     for x in excel_files:
-        out_name = derive_out_name(x)
-        out_path = out_dir / out_name
-        try:
-            total, written, problems = excel_to_kml(x, sheet_name, out_path)
-            print(f"[OK] {x.name} → {out_path.name} (всего: {total}, записано: {written}, пропущено: {len(problems)})")
+        out_path = out_dir / derive_out_name(x)
+        if not force and is_up_to_date(x, sheet_name, out_path):
+            print(f"[SKIP] {x.name} → {out_path.name} (Excel не изменился)")
+            continue
+        tasks.append((x, sheet_name, out_path))
+    if not tasks:
+        return 0
+
+    if jobs is None:
+        jobs = min(os.cpu_count() or 1, len(tasks))
+
+    ok_count = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_worker, t) for t in tasks]
+        for f in as_completed(futures):
+            x_name, out_name, total, written, problems, err = f.result()
+            if err is not None:
+                print(f"[ERR] {x_name}: {err}", file=sys.stderr)
+                continue
+            print(f"[OK] {x_name} → {out_name} (всего: {total}, записано: {written}, пропущено: {len(problems)})")
             if problems:
                 for p in problems:
                     print(" - " + p)
             ok_count += 1
-        except SystemExit as e:
-            print(f"[ERR] {x.name}: {e}", file=sys.stderr)
-        except Exception as e:
-            print(f"[ERR] {x.name}: {e}", file=sys.stderr)
     return ok_count
 
 
+def positive_int(value: str) -> int:
+    """Тип для argparse: целое число ≥ 1."""
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается целое число, получено: {value!r}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"должно быть ≥ 1, получено: {n}")
+    return n
+
+
 def main():
     parser = argparse.ArgumentParser(description="Excel (.xlsx/.xlsm) → KML generator (single file or folder)")
     g = parser.add_mutually_exclusive_group(required=False)
@@ -293,6 +502,12 @@ def main():
 
     parser.add_argument("--out", help="Имя выходного KML-файла (только для --excel). Если не задан, gorod_YYYYMMDD_HHMM.kml")
     parser.add_argument("--out-dir", help="Папка для вывода (только для --in-dir). Если не задана, используется текущая папка.")
+    parser.add_argument(
+        "--jobs", type=positive_int, help="Число параллельных процессов (только для --in-dir). По умолчанию — по числу ядер."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Пересоздать все KML, даже если Excel не менялся (только для --in-dir)"
+    )
 
     args = parser.parse_args()
 
@@ -312,8 +527,9 @@ def main():
         # Дефолт: папка reports рядом со скриптом
         in_dir = Path(args.in_dir) if args.in_dir else (app_base() / "reports")
         out_dir = Path(args.out_dir) if args.out_dir else None  # None => текущая папка
-        count = process_dir(in_dir, out_dir, args.sheet)
+        count = process_dir(in_dir, out_dir, args.sheet, args.jobs, args.force)
         print(f"[DONE] Успешно создано KML: {count} шт. (из {in_dir})")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # для сборки PyInstaller (.exe)
     main()